@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class AuthSettings(BaseSettings):
@@ -6,10 +7,24 @@ class AuthSettings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
     REFRESH_TOKEN_EXPIRE_DAYS: int = 30
     DATABASE_URL: str
+    # Comma separated shard URLs; when set, DATABASE_URL holds the shard directory
+    DATABASE_SHARD_URLS: Optional[str] = None
+    # Shard count before the last shards were appended, set only while rebalancing
+    DATABASE_SHARD_PREVIOUS_COUNT: Optional[int] = None
     SOCIAL_GOOGLE_CLIENT_ID: str
     SOCIAL_GOOGLE_CLIENT_SECRET: str
     SOCIAL_GOOGLE_TOKEN_URL: str = "https://oauth2.googleapis.com/token"
+    # Deprecated and unused since tokens are verified through tokeninfo; kept so
+    # existing .env files that still set it keep loading
     SOCIAL_GOOGLE_USERINFO_URL: str = "https://www.googleapis.com/oauth2/v3/userinfo"
+    SOCIAL_GOOGLE_TOKENINFO_URL: str = "https://oauth2.googleapis.com/tokeninfo"
+    SOCIAL_PROVIDER_TIMEOUT_SECONDS: float = 5
+    SOCIAL_TOKEN_CACHE_TTL_SECONDS: int = 60
+    SOCIAL_TOKEN_CACHE_MAX_ENTRIES: int = 10000
+    ADMIN_API_KEY: Optional[str] = None
+    EXPORT_BATCH_SIZE: int = 1000
+    BREACHED_PASSWORDS_PATH: Optional[str] = None
+    BREACHED_PASSWORDS_BLOOM_PATH: Optional[str] = None
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,45 @@
+import hmac
+import logging
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from lib.config import settings
+from lib.services.export_service import EXPORTS, ExportStats, export_lines
+from lib.utils.dependencies import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin")
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def _require_admin(admin_key: Optional[str]):
+    # compare_digest rejects non-ASCII str with a TypeError, bytes always compare
+    if not settings.ADMIN_API_KEY or not admin_key or not hmac.compare_digest(
+        admin_key.encode("utf-8"), settings.ADMIN_API_KEY.encode("utf-8")
+    ):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+def _stream_export(dataset: str, fmt: str):
+    # The export outlives the request handler, so it owns its session
+    db = SessionLocal()
+    stats = ExportStats()
+    try:
+        yield from export_lines(db, dataset, fmt, stats, settings.EXPORT_BATCH_SIZE)
+    finally:
+        db.close()
+        logger.info("Exported %d %s rows in %.2fs (%.0f rows/sec)",
+                    stats.rows, dataset, stats.elapsed, stats.rows_per_second)
+
+@router.get("/export/{dataset}")
+def export(dataset: str, format: str = "ndjson", x_admin_key: Optional[str] = Header(None)):
+    _require_admin(x_admin_key)
+    if dataset not in EXPORTS:
+        raise HTTPException(status_code=404, detail="Unsupported export dataset")
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported export format")
+    return StreamingResponse(
+        _stream_export(dataset, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename={dataset}.{format}"}
+    )
@@ -1,3 +1,4 @@
+import requests
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from lib.schemas import SocialLoginRequest, TokenResponse
@@ -11,7 +12,13 @@ router = APIRouter()
 @router.post("/social-login", response_model=TokenResponse)
 def social_login(req: SocialLoginRequest, db: Session = Depends(get_db)):
     if req.provider == "google":
-        user_info = verify_google_token(req.access_token)
+        try:
+            user_info = verify_google_token(req.access_token)
+        except ValueError as e:
+            raise HTTPException(status_code=401, detail=str(e))
+        except (TimeoutError, requests.RequestException):
+            # The provider is slow or unreachable, the token may still be valid
+            raise HTTPException(status_code=503, detail="Social provider unavailable, please retry")
         user_id = get_or_create_social_user(db, user_info["email"], user_info["external_id"], provider="google")
         access, refresh = issue_tokens(db, user_id)
         return TokenResponse(access_token=access, refresh_token=refresh)
@@ -0,0 +1,16 @@
+import pytest
+from fastapi import HTTPException
+from unittest.mock import patch
+
+# The controller builds the database engine on import
+pytest.importorskip("psycopg2")
+
+from lib.controllers.admin_controller import _require_admin
+
+def test_require_admin():
+    with patch("lib.controllers.admin_controller.settings.ADMIN_API_KEY", "s3cret-kéy"):
+        _require_admin("s3cret-kéy")
+        for key in (None, "", "wrong", "ключ"):
+            with pytest.raises(HTTPException) as exc:
+                _require_admin(key)
+            assert exc.value.status_code == 403
@@ -0,0 +1,22 @@
+import pytest
+import requests
+from fastapi import HTTPException
+from unittest.mock import MagicMock, patch
+
+# The controller builds the database engine on import
+pytest.importorskip("psycopg2")
+
+from lib.controllers.social_controller import social_login
+from lib.schemas import SocialLoginRequest
+
+def test_social_login_maps_verification_errors():
+    req = SocialLoginRequest(provider="google", access_token="token-a")
+    for error, status_code in (
+        (ValueError("Invalid social token"), 401),
+        (TimeoutError("Social token verification timed out"), 503),
+        (requests.ConnectionError("unreachable"), 503),
+    ):
+        with patch("lib.controllers.social_controller.verify_google_token", side_effect=error):
+            with pytest.raises(HTTPException) as exc:
+                social_login(req, db=MagicMock())
+        assert exc.value.status_code == status_code
@@ -27,3 +27,17 @@ class RefreshToken(Base):
     user_id = Column(String, nullable=False)
     expires_at = Column(DateTime, nullable=False)
     revoked = Column(Boolean, default=False)
+
+# Directory tables live in the DATABASE_URL database when the identity store is
+# sharded, mapping lookup keys to the user id that picks the shard
+DirectoryBase = declarative_base()
+
+class UserDirectory(DirectoryBase):
+    __tablename__ = "user_directory"
+    email = Column(String, primary_key=True)
+    user_id = Column(String, nullable=False, index=True)
+
+class SocialDirectory(DirectoryBase):
+    __tablename__ = "social_directory"
+    external_id = Column(String, primary_key=True)
+    user_id = Column(String, nullable=False, index=True)
@@ -3,6 +3,7 @@ from datetime import datetime, timedelta, timezone
 from sqlalchemy.orm import Session
 from lib.config import settings
 from lib.models import User, RefreshToken, SocialAccount
+from lib.services.breach_service import is_password_breached
 from lib.services.hashing_service import hash_password, verify_password
 from lib.services.token_service import create_access_token, create_refresh_token, decode_token
 
@@ -12,6 +13,9 @@ def register_user(db: Session, email: str, password: str):
     if existing_user:
         # User already exists with email/password method
         raise ValueError("User with this email already exists")
+
+    if is_password_breached(password):
+        raise ValueError("This password has appeared in a data breach, please choose another")
     
     # Create new user
     user_id = str(uuid.uuid4())
@@ -0,0 +1,27 @@
+from lib.config import settings
+from lib.utils.breach_index import BreachedPasswordIndex, password_digest
+from lib.utils.exceptions import ConfigurationError
+
+def load_breached_password_index():
+    if not settings.BREACHED_PASSWORDS_PATH:
+        return None
+    try:
+        return BreachedPasswordIndex(
+            settings.BREACHED_PASSWORDS_PATH,
+            settings.BREACHED_PASSWORDS_BLOOM_PATH
+        )
+    except (OSError, ValueError) as e:
+        # A misconfigured index must stop the worker, not fail every registration
+        raise ConfigurationError(f"Cannot load breached password index: {e}") from e
+
+# Loaded once at import so a bad file fails at startup
+_index = load_breached_password_index()
+
+def get_breached_password_index():
+    return _index
+
+def is_password_breached(password: str) -> bool:
+    index = get_breached_password_index()
+    if index is None:
+        return False
+    return password_digest(password) in index
@@ -0,0 +1,134 @@
+import csv
+import hashlib
+import io
+import json
+import time
+from datetime import datetime, timezone
+from sqlalchemy import select
+from sqlalchemy.ext.horizontal_shard import set_shard_id
+from sqlalchemy.orm import Session, selectinload
+from lib.models import User, RefreshToken
+from lib.utils.sharding import IdentitySession
+
+USER_FIELDS = ["user_id", "email", "is_active", "created_at", "social_accounts"]
+SESSION_FIELDS = ["token_digest", "user_id", "expires_at"]
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+def _keyset_rows(db: Session, stmt, key_column, batch_size: int):
+    # A sharded store is exported one shard at a time so keyset order holds.
+    # ShardedSession merges results with unique(), which rejects yield_per, so
+    # there the keyset LIMIT alone bounds memory.
+    if isinstance(db, IdentitySession):
+        for shard_id in db.router.shards:
+            yield from _keyset_shard_rows(db, stmt.options(set_shard_id(shard_id)), key_column, batch_size, False)
+    else:
+        yield from _keyset_shard_rows(db, stmt, key_column, batch_size, True)
+
+def _keyset_shard_rows(db: Session, stmt, key_column, batch_size: int, stream: bool):
+    # Page on the primary key instead of OFFSET so every page is an index seek,
+    # and stream each page through a server-side cursor where supported
+    last_key = None
+    while True:
+        page = stmt
+        if last_key is not None:
+            page = page.where(key_column > last_key)
+        page = page.order_by(key_column).limit(batch_size)
+        if stream:
+            page = page.execution_options(yield_per=batch_size)
+        fetched = 0
+        for obj in db.execute(page).scalars():
+            fetched += 1
+            last_key = getattr(obj, key_column.key)
+            yield obj
+        # Drop the exported rows from the identity map so memory stays flat
+        db.expunge_all()
+        if fetched < batch_size:
+            return
+
+def iter_users(db: Session, batch_size: int = 1000):
+    # Social accounts are loaded with one IN query per batch, not one per user
+    stmt = select(User).options(selectinload(User.social_accounts))
+    for user in _keyset_rows(db, stmt, User.id, batch_size):
+        yield {
+            "user_id": user.id,
+            "email": user.email,
+            "is_active": user.is_active,
+            "created_at": _isoformat(user.created_at),
+            "social_accounts": [
+                {"provider": s.provider, "external_id": s.external_id}
+                for s in user.social_accounts
+            ],
+        }
+
+def iter_active_sessions(db: Session, batch_size: int = 1000):
+    now = datetime.now(timezone.utc)
+    stmt = select(RefreshToken).where(
+        RefreshToken.revoked == False,
+        RefreshToken.expires_at > now
+    )
+    for token in _keyset_rows(db, stmt, RefreshToken.token, batch_size):
+        # Never export usable refresh tokens, only a digest to correlate on
+        yield {
+            "token_digest": hashlib.sha256(token.token.encode("utf-8")).hexdigest(),
+            "user_id": token.user_id,
+            "expires_at": _isoformat(token.expires_at),
+        }
+
+def to_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row) + "\n"
+
+def to_csv(rows, fields):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    for row in rows:
+        if "social_accounts" in row:
+            row = dict(row)
+            row["social_accounts"] = ";".join(
+                f"{s['provider']}:{s['external_id']}" for s in row["social_accounts"]
+            )
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+class ExportStats:
+    def __init__(self):
+        self.rows = 0
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+
+    def count(self, rows):
+        for row in rows:
+            self.rows += 1
+            yield row
+        self.finished_at = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+EXPORTS = {
+    "users": (iter_users, USER_FIELDS),
+    "sessions": (iter_active_sessions, SESSION_FIELDS),
+}
+
+def export_lines(db: Session, dataset: str, fmt: str, stats: ExportStats = None, batch_size: int = 1000):
+    if dataset not in EXPORTS:
+        raise ValueError("Unsupported export dataset")
+    if fmt not in ("ndjson", "csv"):
+        raise ValueError("Unsupported export format")
+    iter_rows, fields = EXPORTS[dataset]
+    rows = iter_rows(db, batch_size)
+    if stats is not None:
+        rows = stats.count(rows)
+    return to_ndjson(rows) if fmt == "ndjson" else to_csv(rows, fields)
@@ -1,16 +1,133 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
 import requests
 from lib.config import settings
 
-def verify_google_token(access_token: str) -> dict:
-    # Exchange token for user info
-    headers = {"Authorization": f"Bearer {access_token}"}
-    response = requests.get(settings.SOCIAL_GOOGLE_USERINFO_URL, headers=headers)
-    if response.status_code == 200:
-        data = response.json()
-        # data contains email, sub (user id), etc.
-        return {
+# Verified token cache in LRU order: token digest -> (expires_at monotonic, user_info)
+_verified_cache = OrderedDict()
+# In-flight verifications: token digest -> _Flight
+_in_flight = {}
+_lock = threading.Lock()
+_stats = {"upstream_calls": 0, "cache_hits": 0, "coalesced": 0}
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+def _token_digest(access_token: str) -> str:
+    # Never keep raw provider tokens in memory longer than the request
+    return hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+
+def _get_with_deadline(url: str, params: dict, timeout: float):
+    # requests applies its timeout to the connect and to every socket read on
+    # its own, so a slow provider can hold a call far longer. Stream the body and
+    # stop once the total deadline has passed: a read only starts before the
+    # deadline and lasts at most timeout, so the call ends within 2 * timeout.
+    deadline = time.monotonic() + timeout
+    response = requests.get(url, params=params, timeout=timeout, stream=True)
+    try:
+        body = b""
+        for chunk in response.iter_content(chunk_size=8192):
+            if time.monotonic() > deadline:
+                raise TimeoutError("Social token verification timed out")
+            body += chunk
+        if time.monotonic() > deadline:
+            raise TimeoutError("Social token verification timed out")
+        return response.status_code, body
+    finally:
+        response.close()
+
+def _fetch_google_user_info(access_token: str):
+    # tokeninfo returns the user and the token's remaining lifetime in one call
+    status_code, body = _get_with_deadline(
+        settings.SOCIAL_GOOGLE_TOKENINFO_URL,
+        {"access_token": access_token},
+        settings.SOCIAL_PROVIDER_TIMEOUT_SECONDS
+    )
+    if status_code == 200:
+        data = json.loads(body)
+        # data contains email, sub (user id), expires_in, etc.
+        user_info = {
             "email": data["email"],
             "external_id": data["sub"]
         }
+        # Never cache past the token's own lifetime
+        ttl = min(settings.SOCIAL_TOKEN_CACHE_TTL_SECONDS, float(data.get("expires_in", 0)))
+        return user_info, ttl
     else:
         raise ValueError("Invalid social token")
+
+def _cache_put(digest: str, user_info: dict, ttl: float):
+    now = time.monotonic()
+    _verified_cache[digest] = (now + ttl, user_info)
+    _verified_cache.move_to_end(digest)
+    # Sweep expired entries from the cold end, then evict least recently used
+    while _verified_cache:
+        oldest = next(iter(_verified_cache))
+        if _verified_cache[oldest][0] > now and len(_verified_cache) <= settings.SOCIAL_TOKEN_CACHE_MAX_ENTRIES:
+            break
+        del _verified_cache[oldest]
+
+def verify_google_token(access_token: str) -> dict:
+    digest = _token_digest(access_token)
+    with _lock:
+        cached = _verified_cache.get(digest)
+        if cached and cached[0] > time.monotonic():
+            _verified_cache.move_to_end(digest)
+            _stats["cache_hits"] += 1
+            return dict(cached[1])
+        _verified_cache.pop(digest, None)
+
+        flight = _in_flight.get(digest)
+        leader = flight is None
+        if leader:
+            flight = _Flight()
+            _in_flight[digest] = flight
+            _stats["upstream_calls"] += 1
+        else:
+            _stats["coalesced"] += 1
+
+    if not leader:
+        # Another request is already verifying this token, share its outcome.
+        # The leader finishes within 2 * timeout (plus DNS and scheduling
+        # slack), so waiters get its result instead of timing out first
+        if not flight.done.wait(2 * settings.SOCIAL_PROVIDER_TIMEOUT_SECONDS + 1):
+            raise TimeoutError("Social token verification timed out")
+        if flight.error:
+            raise flight.error
+        return dict(flight.result)
+
+    try:
+        user_info, ttl = _fetch_google_user_info(access_token)
+        flight.result = user_info
+        if ttl > 0:
+            with _lock:
+                _cache_put(digest, user_info, ttl)
+        return dict(user_info)
+    except Exception as e:
+        # Failures are shared with waiters but never cached
+        flight.error = e
+        raise
+    finally:
+        with _lock:
+            _in_flight.pop(digest, None)
+        flight.done.set()
+
+def get_verification_stats() -> dict:
+    # upstream_calls vs cache_hits + coalesced shows how many provider round trips were saved
+    with _lock:
+        stats = dict(_stats)
+        stats["cached_tokens"] = len(_verified_cache)
+    stats["upstream_calls_saved"] = stats["cache_hits"] + stats["coalesced"]
+    return stats
+
+def clear_verification_cache():
+    with _lock:
+        _verified_cache.clear()
+        for key in _stats:
+            _stats[key] = 0
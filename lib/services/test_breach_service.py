@@ -0,0 +1,144 @@
+import hashlib
+import os
+import subprocess
+import sys
+import pytest
+from unittest.mock import MagicMock, patch
+from sqlalchemy.orm import Session
+from lib.services.auth_service import register_user
+from lib.services.breach_service import is_password_breached, load_breached_password_index
+from lib.utils.breach_index import BreachedPasswordIndex, password_digest
+from lib.utils.exceptions import ConfigurationError
+from lib.tools.build_breached_passwords import build_index, main
+
+BREACHED = ["password", "123456", "qwerty", "letmein", "dragon"]
+
+@pytest.fixture
+def corpus(tmp_path):
+    path = tmp_path / "pwned.txt"
+    lines = [f"{hashlib.sha1(p.encode()).hexdigest().upper()}:{i + 1}" for i, p in enumerate(BREACHED)]
+    # Duplicates must be collapsed by the builder
+    path.write_text("\n".join(lines + lines[:2]) + "\n")
+    return path
+
+@pytest.fixture
+def index_paths(tmp_path, corpus):
+    index_path = tmp_path / "breached.idx"
+    bloom_path = tmp_path / "breached.bloom"
+    main([str(corpus), "--output", str(index_path), "--bloom", str(bloom_path), "--run-size", "2"])
+    return str(index_path), str(bloom_path)
+
+def test_build_index_sorted_and_deduplicated(tmp_path):
+    digests = [password_digest(p) for p in BREACHED * 2]
+    index_path = tmp_path / "breached.idx"
+    count = build_index(iter(digests), str(index_path), run_size=3)
+    assert count == len(BREACHED)
+    index = BreachedPasswordIndex(str(index_path))
+    assert list(index) == sorted(set(digests))
+    index.close()
+
+def test_index_lookup(index_paths):
+    index = BreachedPasswordIndex(index_paths[0])
+    assert all(password_digest(p) in index for p in BREACHED)
+    assert password_digest("correct horse battery staple") not in index
+    index.close()
+
+def test_index_lookup_with_bloom(index_paths):
+    index = BreachedPasswordIndex(*index_paths)
+    assert all(password_digest(p) in index.bloom for p in BREACHED)
+    assert all(password_digest(p) in index for p in BREACHED)
+    assert password_digest("correct horse battery staple") not in index
+    index.close()
+
+def test_min_count_filter(tmp_path, corpus):
+    index_path = tmp_path / "breached.idx"
+    main([str(corpus), "--output", str(index_path), "--min-count", "3"])
+    index = BreachedPasswordIndex(str(index_path))
+    assert index.count == 3
+    assert password_digest("password") not in index
+    assert password_digest("dragon") in index
+    index.close()
+
+def test_invalid_index_rejected(tmp_path):
+    path = tmp_path / "garbage.idx"
+    path.write_bytes(b"not an index file at all")
+    with pytest.raises(ValueError) as exc:
+        BreachedPasswordIndex(str(path))
+    assert "Invalid breached password index" in str(exc.value)
+
+def test_build_needs_no_app_settings(tmp_path, corpus):
+    # The output is the configured index path and none of the app settings exist
+    output = tmp_path / "breached.idx"
+    env = {"PATH": os.environ.get("PATH", ""), "BREACHED_PASSWORDS_PATH": str(output),
+           "PYTHONPATH": os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))}
+    result = subprocess.run(
+        [sys.executable, "-m", "lib.tools.build_breached_passwords", str(corpus), "--output", str(output)],
+        cwd=tmp_path, env=env, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    assert BreachedPasswordIndex(str(output)).count == len(BREACHED)
+
+def test_rebuild_keeps_mapped_index_valid(tmp_path, index_paths, corpus):
+    index = BreachedPasswordIndex(*index_paths)
+    main([str(corpus), "--output", index_paths[0], "--bloom", index_paths[1], "--min-count", "4"])
+    # The live mapping still sees the old files, a fresh load sees the new ones
+    assert all(password_digest(p) in index for p in BREACHED)
+    index.close()
+    rebuilt = BreachedPasswordIndex(*index_paths)
+    assert rebuilt.count == 2
+    rebuilt.close()
+    assert sorted(os.listdir(tmp_path)) == ["breached.bloom", "breached.idx", "pwned.txt"]
+
+def test_build_rejects_non_sha1_corpus(tmp_path, capsys):
+    corpus = tmp_path / "pwned-ntlm.txt"
+    sha1 = hashlib.sha1(b"password").hexdigest().upper()
+    corpus.write_text(f"{sha1}:3\n8846F7EAEE8FB117AD06BDD830B7586C:5\n")
+    with pytest.raises(SystemExit):
+        main([str(corpus), "--output", str(tmp_path / "breached.idx")])
+    assert "pwned-ntlm.txt:2" in capsys.readouterr().err
+    assert not (tmp_path / "breached.idx").exists()
+
+def test_build_rejects_bad_count(tmp_path, capsys):
+    corpus = tmp_path / "pwned.txt"
+    corpus.write_text(f"{hashlib.sha1(b'password').hexdigest()}:lots\n")
+    with pytest.raises(SystemExit):
+        main([str(corpus), "--output", str(tmp_path / "breached.idx")])
+    assert "pwned.txt:1" in capsys.readouterr().err
+
+def test_truncated_bloom_rejected(tmp_path, index_paths):
+    truncated = tmp_path / "truncated.bloom"
+    with open(index_paths[1], "rb") as f:
+        truncated.write_bytes(f.read()[:-1])
+    with pytest.raises(ValueError) as exc:
+        BreachedPasswordIndex(index_paths[0], str(truncated))
+    assert "bloom filter" in str(exc.value)
+
+def test_load_index_configuration_errors(tmp_path, index_paths):
+    garbage = tmp_path / "garbage.idx"
+    garbage.write_bytes(b"not an index file at all")
+    with patch("lib.services.breach_service.settings.BREACHED_PASSWORDS_BLOOM_PATH", None):
+        for path in (str(tmp_path / "missing.idx"), str(garbage)):
+            with patch("lib.services.breach_service.settings.BREACHED_PASSWORDS_PATH", path):
+                with pytest.raises(ConfigurationError):
+                    load_breached_password_index()
+        with patch("lib.services.breach_service.settings.BREACHED_PASSWORDS_PATH", index_paths[0]):
+            index = load_breached_password_index()
+    assert password_digest("dragon") in index
+    index.close()
+
+def test_is_password_breached_disabled():
+    with patch("lib.services.breach_service.get_breached_password_index", return_value=None):
+        assert is_password_breached("password") is False
+
+def test_register_user_breached_password(index_paths):
+    db_session = MagicMock(spec=Session)
+    db_session.query.return_value.filter.return_value.first.return_value = None
+    index = BreachedPasswordIndex(*index_paths)
+    with patch("lib.services.breach_service.get_breached_password_index", return_value=index):
+        with pytest.raises(ValueError) as exc:
+            register_user(db_session, "newuser@example.com", "letmein")
+        assert "data breach" in str(exc.value)
+        db_session.add.assert_not_called()
+
+        assert register_user(db_session, "newuser@example.com", "correct horse battery staple")
+    index.close()
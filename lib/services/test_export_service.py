@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+import pytest
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from lib.models import Base, User, SocialAccount, RefreshToken
+from lib.services.export_service import (
+    ExportStats, export_lines, iter_users, iter_active_sessions
+)
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    return engine
+
+@pytest.fixture
+def db_session(engine):
+    SessionLocal = sessionmaker(bind=engine)
+    session = SessionLocal()
+    now = datetime.now(timezone.utc)
+    for i in range(7):
+        user_id = f"u{i:02d}"
+        session.add(User(id=user_id, email=f"user{i}@example.com", hashed_password="x", is_active=True))
+        session.add(SocialAccount(id=f"s{i:02d}", user_id=user_id, provider="google", external_id=f"google-{i}"))
+        session.add(RefreshToken(token=f"t{i:02d}", user_id=user_id, expires_at=now + timedelta(days=1), revoked=False))
+    session.add(RefreshToken(token="revoked", user_id="u00", expires_at=now + timedelta(days=1), revoked=True))
+    session.add(RefreshToken(token="expired", user_id="u00", expires_at=now - timedelta(days=1), revoked=False))
+    session.commit()
+    session.expunge_all()
+    try:
+        yield session
+    finally:
+        session.close()
+
+def test_iter_users_keyset_pages(engine, db_session):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    rows = list(iter_users(db_session, batch_size=3))
+
+    assert [r["user_id"] for r in rows] == [f"u{i:02d}" for i in range(7)]
+    assert rows[0]["social_accounts"] == [{"provider": "google", "external_id": "google-0"}]
+    assert all("hashed_password" not in r for r in rows)
+    # 3 pages of users plus one batched social account load per page
+    assert len(statements) == 6
+    # Later pages seek past the last exported key
+    assert "users.id > ?" in statements[2]
+    assert "users.id > ?" in statements[4]
+
+def test_iter_users_releases_identity_map(db_session):
+    for _ in iter_users(db_session, batch_size=2):
+        assert len(db_session.identity_map) <= 2 * 2
+
+def test_iter_active_sessions_only_active(db_session):
+    rows = list(iter_active_sessions(db_session, batch_size=4))
+    assert len(rows) == 7
+    assert {r["user_id"] for r in rows} == {f"u{i:02d}" for i in range(7)}
+    # Raw refresh tokens must never leave the service
+    assert all(len(r["token_digest"]) == 64 for r in rows)
+    assert not any(r["token_digest"].startswith("t0") for r in rows)
+
+def test_export_lines_ndjson(db_session):
+    stats = ExportStats()
+    lines = list(export_lines(db_session, "users", "ndjson", stats, batch_size=3))
+    assert len(lines) == 7
+    assert json.loads(lines[0])["email"] == "user0@example.com"
+    assert stats.rows == 7
+    assert stats.rows_per_second > 0
+
+def test_export_lines_csv(db_session):
+    content = "".join(export_lines(db_session, "users", "csv", batch_size=3))
+    rows = list(csv.DictReader(io.StringIO(content)))
+    assert len(rows) == 7
+    assert rows[0]["social_accounts"] == "google:google-0"
+
+def test_export_lines_unsupported(db_session):
+    with pytest.raises(ValueError) as exc:
+        export_lines(db_session, "passwords", "ndjson")
+    assert "Unsupported export dataset" in str(exc.value)
@@ -0,0 +1,177 @@
+import json
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+from lib.services.social_service import (
+    verify_google_token, get_verification_stats, clear_verification_cache
+)
+
+@pytest.fixture(autouse=True)
+def reset_cache():
+    clear_verification_cache()
+    yield
+    clear_verification_cache()
+
+def google_response(status_code=200, chunks=None, **extra):
+    response = MagicMock()
+    response.status_code = status_code
+    # tokeninfo reports expires_in as a string
+    body = {"email": "player@example.com", "sub": "google-123", "expires_in": "3599", **extra}
+    body = json.dumps({k: v for k, v in body.items() if v is not None}).encode()
+    response.iter_content.return_value = chunks if chunks is not None else [body]
+    return response
+
+def test_verify_google_token_success():
+    with patch("lib.services.social_service.requests.get", return_value=google_response()) as get:
+        user_info = verify_google_token("token-a")
+    assert user_info == {"email": "player@example.com", "external_id": "google-123"}
+    get.assert_called_once()
+    assert get.call_args.kwargs["params"] == {"access_token": "token-a"}
+    assert get.call_args.kwargs["timeout"] > 0
+
+def test_verify_google_token_cached():
+    with patch("lib.services.social_service.requests.get", return_value=google_response()) as get:
+        verify_google_token("token-a")
+        verify_google_token("token-a")
+    get.assert_called_once()
+    stats = get_verification_stats()
+    assert stats["upstream_calls"] == 1
+    assert stats["cache_hits"] == 1
+    assert stats["upstream_calls_saved"] == 1
+
+def test_verify_google_token_cache_capped_by_token_lifetime():
+    with patch("lib.services.social_service.requests.get", return_value=google_response(expires_in="0")) as get:
+        verify_google_token("token-a")
+        verify_google_token("token-a")
+    assert get.call_count == 2
+
+def test_verify_google_token_without_lifetime_not_cached():
+    with patch("lib.services.social_service.requests.get", return_value=google_response(expires_in=None)) as get:
+        verify_google_token("token-a")
+        verify_google_token("token-a")
+    assert get.call_count == 2
+
+def test_verify_google_token_cache_bounded():
+    with patch("lib.services.social_service.settings.SOCIAL_TOKEN_CACHE_MAX_ENTRIES", 3), \
+            patch("lib.services.social_service.requests.get", return_value=google_response()) as get:
+        for i in range(10):
+            verify_google_token(f"token-{i}")
+        assert get_verification_stats()["cached_tokens"] == 3
+        # Most recently used entries survive, the oldest were evicted
+        verify_google_token("token-9")
+        verify_google_token("token-0")
+    assert get.call_count == 11
+
+def test_verify_google_token_expired_entries_swept():
+    with patch("lib.services.social_service.requests.get", return_value=google_response()), \
+            patch("lib.services.social_service.time.monotonic", return_value=1000.0):
+        verify_google_token("token-a")
+    with patch("lib.services.social_service.requests.get", return_value=google_response()), \
+            patch("lib.services.social_service.time.monotonic", return_value=1000.0 + 3600):
+        verify_google_token("token-b")
+    assert get_verification_stats()["cached_tokens"] == 1
+
+def test_verify_google_token_invalid_not_cached():
+    with patch("lib.services.social_service.requests.get", return_value=google_response(status_code=401)) as get:
+        with pytest.raises(ValueError) as exc:
+            verify_google_token("bad-token")
+        with pytest.raises(ValueError):
+            verify_google_token("bad-token")
+    assert "Invalid social token" in str(exc.value)
+    assert get.call_count == 2
+
+def test_verify_google_token_coalesces_concurrent_calls():
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_get(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        return google_response()
+
+    results = []
+    with patch("lib.services.social_service.requests.get", side_effect=slow_get) as get:
+        leader = threading.Thread(target=lambda: results.append(verify_google_token("token-a")))
+        leader.start()
+        started.wait(5)
+        followers = [
+            threading.Thread(target=lambda: results.append(verify_google_token("token-a")))
+            for _ in range(3)
+        ]
+        for t in followers:
+            t.start()
+        # Wait until every follower has joined the in-flight call
+        while get_verification_stats()["coalesced"] < 3:
+            time.sleep(0.001)
+        release.set()
+        for t in [leader] + followers:
+            t.join(5)
+
+    get.assert_called_once()
+    assert len(results) == 4
+    assert all(r["external_id"] == "google-123" for r in results)
+    assert get_verification_stats()["coalesced"] == 3
+
+def test_verify_google_token_waiter_times_out():
+    release = threading.Event()
+    started = threading.Event()
+
+    def stalled_get(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        return google_response()
+
+    with patch("lib.services.social_service.settings.SOCIAL_PROVIDER_TIMEOUT_SECONDS", 0.05), \
+            patch("lib.services.social_service.requests.get", side_effect=stalled_get):
+        leader = threading.Thread(target=verify_google_token, args=("token-a",))
+        leader.start()
+        started.wait(5)
+        with pytest.raises(TimeoutError):
+            verify_google_token("token-a")
+        release.set()
+        leader.join(5)
+
+def test_verify_google_token_total_deadline():
+    def trickle():
+        # Every read is within the per-read timeout, the whole body is not
+        for _ in range(100):
+            time.sleep(0.01)
+            yield b" "
+
+    with patch("lib.services.social_service.settings.SOCIAL_PROVIDER_TIMEOUT_SECONDS", 0.05), \
+            patch("lib.services.social_service.requests.get", return_value=google_response(chunks=trickle())) as get:
+        with pytest.raises(TimeoutError):
+            verify_google_token("token-a")
+    get.return_value.close.assert_called_once()
+
+def test_verify_google_token_waiter_shares_leader_outcome():
+    started = threading.Event()
+
+    def slow_body():
+        time.sleep(0.03)
+        yield b"{}"
+
+    def slow_get(*args, **kwargs):
+        started.set()
+        time.sleep(0.04)
+        return google_response(chunks=slow_body())
+
+    errors = []
+
+    def leader_call():
+        try:
+            verify_google_token("token-a")
+        except TimeoutError as e:
+            errors.append(e)
+
+    with patch("lib.services.social_service.settings.SOCIAL_PROVIDER_TIMEOUT_SECONDS", 0.05), \
+            patch("lib.services.social_service.requests.get", side_effect=slow_get):
+        leader = threading.Thread(target=leader_call)
+        leader.start()
+        started.wait(5)
+        # The waiter outlasts the leader's deadline and gets its outcome
+        with pytest.raises(TimeoutError) as exc:
+            verify_google_token("token-a")
+        leader.join(5)
+    assert errors == [exc.value]
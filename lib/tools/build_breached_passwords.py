@@ -0,0 +1,135 @@
+"""Compile a breached password corpus into the index read by breach_service.
+
+Accepts the Have I Been Pwned SHA-1 download ("HASH:COUNT" per line) or, with
+--plain, one plaintext password per line:
+
+    python -m lib.tools.build_breached_passwords pwned-passwords-sha1.txt \\
+        --output breached.idx --bloom breached.bloom
+"""
+
+import argparse
+import heapq
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+# Only the side-effect free format module, so building needs no app settings
+# and never loads the index it is about to replace
+from lib.utils.breach_index import (
+    DIGEST_SIZE, INDEX_HEADER, INDEX_MAGIC, BreachedPasswordIndex, build_bloom, password_digest
+)
+
+def _parse_digests(path: str, plain: bool, min_count: int):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.rstrip("\r\n")
+            if not line:
+                continue
+            if plain:
+                yield password_digest(line)
+                continue
+            hex_digest, _, count = line.partition(":")
+            try:
+                digest = bytes.fromhex(hex_digest)
+                count = int(count) if count else None
+            except ValueError:
+                raise ValueError(f"{path}:{line_number}: expected HASH:COUNT, got {line[:60]!r}")
+            # Other corpora (e.g. the NTLM download) would misalign the fixed-size records
+            if len(digest) != DIGEST_SIZE:
+                raise ValueError(f"{path}:{line_number}: expected a {DIGEST_SIZE * 2}-character SHA-1 hash, "
+                                 f"got {len(hex_digest)} characters")
+            if count is not None and count < min_count:
+                continue
+            yield digest
+
+def _write_run(digests, tmp_dir: str) -> str:
+    digests.sort()
+    fd, path = tempfile.mkstemp(dir=tmp_dir, suffix=".run")
+    with os.fdopen(fd, "wb") as f:
+        f.write(b"".join(digests))
+    return path
+
+def _read_run(path: str):
+    with open(path, "rb") as f:
+        while True:
+            digest = f.read(DIGEST_SIZE)
+            if not digest:
+                return
+            yield digest
+
+@contextmanager
+def _atomic_output(path: str):
+    # Workers keep the old file memory-mapped; truncating it in place would kill
+    # them with SIGBUS. Write a sibling file and rename it over the old one, so
+    # existing mappings keep the old inode and new loads see the new file.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        # mkstemp creates 0600 files; keep the mode workers could read before
+        os.chmod(tmp_path, os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644)
+        with os.fdopen(fd, "wb") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def build_index(digests, output: str, run_size: int = 1_000_000) -> int:
+    # External merge sort: sorted runs on disk, then a streaming k-way merge,
+    # so corpora far larger than RAM can be compiled
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output))) as tmp_dir:
+        runs, chunk = [], []
+        for digest in digests:
+            if len(digest) != DIGEST_SIZE:
+                raise ValueError(f"Expected {DIGEST_SIZE}-byte SHA-1 digests, got {len(digest)} bytes")
+            chunk.append(digest)
+            if len(chunk) >= run_size:
+                runs.append(_write_run(chunk, tmp_dir))
+                chunk = []
+        if chunk:
+            runs.append(_write_run(chunk, tmp_dir))
+
+        count, previous = 0, None
+        with _atomic_output(output) as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, 0))
+            for digest in heapq.merge(*(_read_run(run) for run in runs)):
+                if digest != previous:
+                    f.write(digest)
+                    count += 1
+                    previous = digest
+            f.seek(0)
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, count))
+    return count
+
+def build_bloom_file(index_path: str, output: str, false_positive_rate: float):
+    index = BreachedPasswordIndex(index_path)
+    try:
+        data = build_bloom(iter(index), index.count, false_positive_rate)
+    finally:
+        index.close()
+    with _atomic_output(output) as f:
+        f.write(data)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the breached password index")
+    parser.add_argument("corpus", help="downloaded corpus file")
+    parser.add_argument("--output", required=True, help="index file to write")
+    parser.add_argument("--plain", action="store_true", help="corpus holds plaintext passwords")
+    parser.add_argument("--min-count", type=int, default=1, help="skip hashes seen fewer times than this")
+    parser.add_argument("--bloom", help="also write a bloom filter front to this file")
+    parser.add_argument("--false-positive-rate", type=float, default=0.01)
+    parser.add_argument("--run-size", type=int, default=1_000_000, help="digests sorted in memory per run")
+    args = parser.parse_args(argv)
+
+    try:
+        count = build_index(_parse_digests(args.corpus, args.plain, args.min_count), args.output, args.run_size)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Wrote {count} digests to {args.output}", file=sys.stderr)
+    if args.bloom:
+        build_bloom_file(args.output, args.bloom, args.false_positive_rate)
+        print(f"Wrote bloom filter to {args.bloom}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
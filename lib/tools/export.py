@@ -0,0 +1,34 @@
+"""Stream users or active sessions to stdout or a file.
+
+    python -m lib.tools.export users --format csv --output users.csv
+"""
+
+import argparse
+import sys
+from lib.config import settings
+from lib.services.export_service import EXPORTS, ExportStats, export_lines
+from lib.utils.dependencies import SessionLocal
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the identity store as NDJSON or CSV")
+    parser.add_argument("dataset", choices=sorted(EXPORTS))
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--output", help="file to write to (default: stdout)")
+    parser.add_argument("--batch-size", type=int, default=settings.EXPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    db = SessionLocal()
+    stats = ExportStats()
+    try:
+        for line in export_lines(db, args.dataset, args.format, stats, args.batch_size):
+            out.write(line)
+    finally:
+        db.close()
+        if args.output:
+            out.close()
+    print(f"Exported {stats.rows} {args.dataset} rows in {stats.elapsed:.2f}s "
+          f"({stats.rows_per_second:.0f} rows/sec)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Move users onto the shard their id hashes to under DATABASE_SHARD_URLS.
+
+Adding shards needs no downtime:
+
+1. Append the new URLs to DATABASE_SHARD_URLS and set
+   DATABASE_SHARD_PREVIOUS_COUNT to the old number of shards, then deploy.
+   Users whose home moved are served from either shard meanwhile.
+2. Run this tool until it reports that all users are on their home shard.
+3. Unset DATABASE_SHARD_PREVIOUS_COUNT.
+
+--from drains retired shards or the original unsharded database. The service
+never reads those, so drain them before switching traffic to the shards:
+
+    python -m lib.tools.rebalance_shards --from postgresql://old-db/authdb --rebuild-directory
+"""
+
+import argparse
+import sys
+from sqlalchemy import create_engine, delete, insert, select, union, update
+from sqlalchemy.dialects import postgresql, sqlite
+from lib.config import settings
+from lib.models import User, SocialAccount, RefreshToken, UserDirectory, SocialDirectory
+from lib.utils.sharding import ShardRouter
+
+# Parents first on insert, children first on delete
+USER_TABLES = [User.__table__, SocialAccount.__table__, RefreshToken.__table__]
+
+def _iter_user_ids(engine, batch_size: int):
+    # Include child rows whose user already moved, e.g. a refresh token issued
+    # on the old shard while its user was being copied
+    owners = union(
+        select(User.__table__.c.id.label("user_id")),
+        select(SocialAccount.__table__.c.user_id),
+        select(RefreshToken.__table__.c.user_id),
+    ).subquery()
+    last_id = None
+    while True:
+        stmt = select(owners.c.user_id).order_by(owners.c.user_id).limit(batch_size)
+        if last_id is not None:
+            stmt = stmt.where(owners.c.user_id > last_id)
+        with engine.connect() as conn:
+            ids = conn.execute(stmt).scalars().all()
+        yield from ids
+        if len(ids) < batch_size:
+            return
+        last_id = ids[-1]
+
+def _user_filter(table, user_id: str):
+    return table.c.id == user_id if table is User.__table__ else table.c.user_id == user_id
+
+def _primary_key(table):
+    return table.primary_key.columns.values()[0]
+
+def move_user(source, target, user_id: str):
+    # The service keeps writing while we copy, so repeat until the source holds
+    # nothing for this user. Source rows win over copies left on the target by
+    # an interrupted run; rows created on the target since are left alone.
+    while True:
+        with source.connect() as src:
+            rows = {table: [dict(r._mapping) for r in src.execute(select(table).where(_user_filter(table, user_id)))]
+                    for table in USER_TABLES}
+        if not any(rows.values()):
+            return
+        keys = {table: [row[_primary_key(table).name] for row in rows[table]] for table in USER_TABLES}
+        with target.begin() as dst:
+            for table in USER_TABLES:
+                pk = _primary_key(table)
+                existing = set(dst.execute(select(pk).where(pk.in_(keys[table]))).scalars()) if keys[table] else set()
+                for row in rows[table]:
+                    if row[pk.name] in existing:
+                        dst.execute(update(table).where(pk == row[pk.name]).values(row))
+                missing = [row for row in rows[table] if row[pk.name] not in existing]
+                if missing:
+                    dst.execute(insert(table), missing)
+        with source.begin() as src:
+            # Delete only what was copied; anything newer is picked up next pass
+            for table in reversed(USER_TABLES):
+                if keys[table]:
+                    src.execute(delete(table).where(_primary_key(table).in_(keys[table])))
+
+def rebalance(router: ShardRouter, extra_sources=(), batch_size: int = 1000, dry_run: bool = False) -> dict:
+    sources = [(shard_id, engine) for shard_id, engine in router.shards.items()]
+    sources += [(None, create_engine(url)) for url in extra_sources]
+    moved = {}
+    for source_id, source in sources:
+        for user_id in _iter_user_ids(source, batch_size):
+            target_id = router.shard_for_user(user_id)
+            if target_id == source_id:
+                continue
+            moved[(source_id, target_id)] = moved.get((source_id, target_id), 0) + 1
+            if not dry_run:
+                move_user(source, router.shards[target_id], user_id)
+    return moved
+
+def _upsert(dialect: str, table, rows, key: str):
+    if dialect == "postgresql":
+        stmt = postgresql.insert(table)
+    else:
+        stmt = sqlite.insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[key], set_={"user_id": stmt.excluded.user_id}
+    ).values(rows)
+
+def rebuild_directory(router: ShardRouter, batch_size: int = 1000) -> int:
+    count = 0
+    dialect = router.directory_engine.dialect.name
+    for shard in router.shards.values():
+        for table, directory, key, column in (
+            (User.__table__, UserDirectory.__table__, "email", User.__table__.c.email),
+            (SocialAccount.__table__, SocialDirectory.__table__, "external_id", SocialAccount.__table__.c.external_id),
+        ):
+            user_id = User.__table__.c.id if table is User.__table__ else table.c.user_id
+            last_key = None
+            while True:
+                stmt = select(column, user_id).order_by(column).limit(batch_size)
+                if last_key is not None:
+                    stmt = stmt.where(column > last_key)
+                with shard.connect() as conn:
+                    rows = [{key: k, "user_id": u} for k, u in conn.execute(stmt)]
+                if rows:
+                    with router.directory_engine.begin() as conn:
+                        conn.execute(_upsert(dialect, directory, rows, key))
+                    count += len(rows)
+                if len(rows) < batch_size:
+                    break
+                last_key = rows[-1][key]
+    return count
+
+def prune_directory(router: ShardRouter, batch_size: int = 1000) -> int:
+    # Drop entries no shard backs, e.g. left by a directory commit whose shard
+    # commit failed; they would otherwise block re-registering the email.
+    # Every shard is checked so users that have not moved yet are kept; do not
+    # run this concurrently with a rebalance.
+    removed = 0
+    for directory, key, column, owner in (
+        (UserDirectory.__table__, "email", User.__table__.c.email, User.__table__.c.id),
+        (SocialDirectory.__table__, "external_id", SocialAccount.__table__.c.external_id,
+         SocialAccount.__table__.c.user_id),
+    ):
+        last_key = None
+        while True:
+            stmt = select(directory.c[key], directory.c.user_id).order_by(directory.c[key]).limit(batch_size)
+            if last_key is not None:
+                stmt = stmt.where(directory.c[key] > last_key)
+            with router.directory_engine.connect() as conn:
+                entries = [tuple(r) for r in conn.execute(stmt)]
+            if not entries:
+                break
+            keys = [k for k, _ in entries]
+            live = set()
+            for shard in router.shards.values():
+                with shard.connect() as conn:
+                    live.update(tuple(r) for r in conn.execute(select(column, owner).where(column.in_(keys))))
+            stale = [k for k, u in entries if (k, u) not in live]
+            if stale:
+                with router.directory_engine.begin() as conn:
+                    conn.execute(delete(directory).where(directory.c[key].in_(stale)))
+                removed += len(stale)
+            if len(entries) < batch_size:
+                break
+            last_key = entries[-1][0]
+    return removed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebalance the sharded identity store")
+    parser.add_argument("--from", dest="extra_sources", action="append", default=[],
+                        help="additional database to drain into the shards (repeatable)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="report moves without changing anything")
+    parser.add_argument("--init", action="store_true", help="create missing tables on every shard and the directory")
+    parser.add_argument("--rebuild-directory", action="store_true",
+                        help="repopulate the directory from the shards and drop entries they do not back")
+    args = parser.parse_args(argv)
+
+    if not settings.DATABASE_SHARD_URLS:
+        parser.error("DATABASE_SHARD_URLS is not configured")
+    router = ShardRouter(
+        settings.DATABASE_SHARD_URLS.split(","),
+        settings.DATABASE_URL,
+        settings.DATABASE_SHARD_PREVIOUS_COUNT
+    )
+    if args.init:
+        router.create_all()
+
+    moved = rebalance(router, args.extra_sources, args.batch_size, args.dry_run)
+    for (source_id, target_id), count in sorted(moved.items(), key=str):
+        source = f"shard {source_id}" if source_id is not None else "external source"
+        print(f"{'Would move' if args.dry_run else 'Moved'} {count} users from {source} to shard {target_id}",
+              file=sys.stderr)
+    if not moved:
+        print("All users are on their home shard", file=sys.stderr)
+
+    if args.rebuild_directory and not args.dry_run:
+        count = rebuild_directory(router, args.batch_size)
+        removed = prune_directory(router, args.batch_size)
+        print(f"Rebuilt {count} directory entries, removed {removed} stale entries", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
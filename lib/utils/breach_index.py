@@ -0,0 +1,98 @@
+import hashlib
+import math
+import mmap
+import struct
+
+# Index file: magic, record count, then sorted unique 20-byte SHA-1 digests
+INDEX_MAGIC = b"PWNDSHA1"
+INDEX_HEADER = struct.Struct(">8sQ")
+DIGEST_SIZE = 20
+
+# Bloom filter file: magic, bit count, hash count, then the bit array
+BLOOM_MAGIC = b"PWNDBLM1"
+BLOOM_HEADER = struct.Struct(">8sQI")
+
+def password_digest(password: str) -> bytes:
+    return hashlib.sha1(password.encode("utf-8")).digest()
+
+def _bloom_positions(digest: bytes, bits: int, hashes: int):
+    # SHA-1 output is already uniform, so slice it for double hashing
+    h1 = int.from_bytes(digest[0:8], "big")
+    h2 = int.from_bytes(digest[8:16], "big") | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+def bloom_parameters(count: int, false_positive_rate: float):
+    bits = max(8, math.ceil(-count * math.log(false_positive_rate) / (math.log(2) ** 2)))
+    hashes = max(1, round(bits / max(count, 1) * math.log(2)))
+    return bits, hashes
+
+def build_bloom(digests, count: int, false_positive_rate: float = 0.01) -> bytes:
+    bits, hashes = bloom_parameters(count, false_positive_rate)
+    array = bytearray((bits + 7) // 8)
+    for digest in digests:
+        for pos in _bloom_positions(digest, bits, hashes):
+            array[pos >> 3] |= 1 << (pos & 7)
+    return BLOOM_HEADER.pack(BLOOM_MAGIC, bits, hashes) + bytes(array)
+
+class BloomFilter:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < BLOOM_HEADER.size:
+            raise ValueError("Invalid breached password bloom filter")
+        magic, self.bits, self.hashes = BLOOM_HEADER.unpack_from(self._map, 0)
+        # A truncated filter would otherwise fail with IndexError mid-lookup
+        if magic != BLOOM_MAGIC or self.bits == 0 or len(self._map) != BLOOM_HEADER.size + (self.bits + 7) // 8:
+            raise ValueError("Invalid breached password bloom filter")
+
+    def __contains__(self, digest: bytes) -> bool:
+        offset = BLOOM_HEADER.size
+        for pos in _bloom_positions(digest, self.bits, self.hashes):
+            if not self._map[offset + (pos >> 3)] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def close(self):
+        self._map.close()
+
+class BreachedPasswordIndex:
+    def __init__(self, path: str, bloom_path: str = None):
+        with open(path, "rb") as f:
+            # Read-only shared mapping: pages come from the OS page cache and are
+            # shared by every worker process instead of being copied per process
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < INDEX_HEADER.size:
+            raise ValueError("Invalid breached password index")
+        magic, self.count = INDEX_HEADER.unpack_from(self._map, 0)
+        if magic != INDEX_MAGIC or len(self._map) != INDEX_HEADER.size + self.count * DIGEST_SIZE:
+            raise ValueError("Invalid breached password index")
+        try:
+            self.bloom = BloomFilter(bloom_path) if bloom_path else None
+        except Exception:
+            self._map.close()
+            raise
+
+    def _digest_at(self, i: int) -> bytes:
+        start = INDEX_HEADER.size + i * DIGEST_SIZE
+        return self._map[start:start + DIGEST_SIZE]
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self._digest_at(i)
+
+    def __contains__(self, digest: bytes) -> bool:
+        if self.bloom is not None and digest not in self.bloom:
+            return False
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._digest_at(mid) < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo < self.count and self._digest_at(lo) == digest
+
+    def close(self):
+        self._map.close()
+        if self.bloom is not None:
+            self.bloom.close()
@@ -4,9 +4,20 @@ from sqlalchemy.orm import sessionmaker
 
 from lib.config import settings
 from lib.models import Base
+from lib.utils.sharding import IdentitySession, ShardRouter
 
-engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+if settings.DATABASE_SHARD_URLS:
+    shard_router = ShardRouter(
+        settings.DATABASE_SHARD_URLS.split(","),
+        settings.DATABASE_URL,
+        settings.DATABASE_SHARD_PREVIOUS_COUNT
+    )
+    engine = shard_router.directory_engine
+    SessionLocal = sessionmaker(class_=IdentitySession, router=shard_router, autocommit=False, autoflush=False)
+else:
+    shard_router = None
+    engine = create_engine(settings.DATABASE_URL)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
     db = SessionLocal()
@@ -1,2 +1,5 @@
 class AuthError(Exception):
     pass
+
+class ConfigurationError(Exception):
+    pass
@@ -0,0 +1,204 @@
+import hashlib
+import jwt
+from sqlalchemy import create_engine, event, inspect, select
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import object_session, sessionmaker
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList
+from lib.models import Base, DirectoryBase, User, SocialAccount, UserDirectory, SocialDirectory
+
+def jump_hash(key: int, buckets: int) -> int:
+    # Jump consistent hash (Lamping & Veach): going from N to N+1 shards only
+    # moves 1/(N+1) of the users, all of them onto the new shard
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+def shard_for_user(user_id: str, shard_count: int) -> str:
+    key = int.from_bytes(hashlib.sha256(user_id.encode("utf-8")).digest()[:8], "big")
+    return str(jump_hash(key, shard_count))
+
+def _conjuncts(clause):
+    # Flatten nested ANDs; anything else (OR, NOT, ...) is a single opaque term
+    if isinstance(clause, BooleanClauseList) and clause.operator is operators.and_:
+        for child in clause.clauses:
+            yield from _conjuncts(child)
+    else:
+        yield clause
+
+def _equality_criteria(statement):
+    # Collect "column = value" terms that every matching row must satisfy, i.e.
+    # the top-level AND conjuncts of the WHERE clause. Comparisons under an OR
+    # are ignored, so such queries fan out to every shard.
+    criteria = []
+    whereclause = getattr(statement, "whereclause", None)
+    if whereclause is None:
+        return criteria
+    for term in _conjuncts(whereclause):
+        if not isinstance(term, BinaryExpression) or term.operator is not operators.eq:
+            continue
+        column, param = term.left, term.right
+        if isinstance(column, BindParameter):
+            column, param = param, column
+        table = getattr(column, "table", None)
+        if table is not None and isinstance(param, BindParameter):
+            criteria.append((table.name, column.name, param.effective_value))
+    return criteria
+
+class ShardRouter:
+    """Routes identity rows to shards by a jump hash of the user id.
+
+    While a layout change is being rebalanced, ``previous_shard_count`` is the
+    shard count before new shards were appended. Users whose home moved are then
+    read from both their new and previous shard, and their new rows are written
+    next to wherever the user currently lives, so no downtime is needed.
+    """
+
+    def __init__(self, shard_urls, directory_url: str, previous_shard_count: int = None):
+        self.shards = {str(i): create_engine(url) for i, url in enumerate(shard_urls)}
+        if previous_shard_count is not None and not 0 < previous_shard_count <= len(self.shards):
+            raise ValueError("previous_shard_count must be between 1 and the number of shards")
+        self.previous_shard_count = previous_shard_count
+        self.directory_engine = create_engine(directory_url)
+        self.DirectorySession = sessionmaker(bind=self.directory_engine, autoflush=False)
+
+    def create_all(self):
+        for shard_engine in self.shards.values():
+            Base.metadata.create_all(shard_engine)
+        DirectoryBase.metadata.create_all(self.directory_engine)
+
+    def shard_for_user(self, user_id: str) -> str:
+        return shard_for_user(user_id, len(self.shards))
+
+    def shards_for_user(self, user_id: str):
+        home = self.shard_for_user(user_id)
+        if self.previous_shard_count:
+            previous = shard_for_user(user_id, self.previous_shard_count)
+            if previous != home:
+                return [home, previous]
+        return [home]
+
+    def _shard_holding_user(self, instance, user_id: str) -> str:
+        candidates = self.shards_for_user(user_id)
+        if len(candidates) == 1:
+            return candidates[0]
+        # Mid-rebalance the user may not have moved yet; prefer a copy the
+        # session already knows about, then whichever shard has the row
+        session = object_session(instance)
+        if session is not None:
+            for obj in list(session.new) + list(session.identity_map.values()):
+                if isinstance(obj, User) and obj.id == user_id:
+                    return inspect(obj).identity_token or candidates[0]
+        users = User.__table__
+        for shard_id in candidates:
+            with self.shards[shard_id].connect() as conn:
+                if conn.execute(select(users.c.id).where(users.c.id == user_id)).first():
+                    return shard_id
+        return candidates[0]
+
+    def shard_chooser(self, mapper, instance, clause=None):
+        if isinstance(instance, User):
+            return self.shard_for_user(instance.id)
+        # SocialAccount and RefreshToken live next to their user
+        return self._shard_holding_user(instance, instance.user_id)
+
+    def identity_chooser(self, mapper, primary_key, *, lazy_loaded_from, **kw):
+        if lazy_loaded_from:
+            return [lazy_loaded_from.identity_token]
+        if mapper.class_ is User:
+            return self.shards_for_user(primary_key[0])
+        return list(self.shards)
+
+    def _user_id_for_token(self, token: str):
+        # Refresh tokens carry their user id; the signature is checked later by
+        # the token service, routing only needs the subject
+        try:
+            return jwt.decode(token, options={"verify_signature": False}).get("sub")
+        except jwt.PyJWTError:
+            return None
+
+    def _route(self, session, table: str, column: str, value):
+        if column == "user_id" or (table == "users" and column == "id"):
+            return value
+        if table == "users" and column == "email":
+            entry = session.directory.get(UserDirectory, value)
+            return entry.user_id if entry else ""
+        if table == "social_accounts" and column == "external_id":
+            entry = session.directory.get(SocialDirectory, value)
+            return entry.user_id if entry else ""
+        if table == "refresh_tokens" and column == "token":
+            return self._user_id_for_token(value)
+        return None
+
+    def execute_chooser(self, orm_context):
+        if orm_context.lazy_loaded_from:
+            return [orm_context.lazy_loaded_from.identity_token]
+        for table, column, value in _equality_criteria(orm_context.statement):
+            user_id = self._route(orm_context.session, table, column, value)
+            if user_id == "":
+                # The directory is authoritative: a miss means no shard holds the
+                # row, so a single shard answers with the same empty result
+                return [next(iter(self.shards))]
+            if user_id:
+                return self.shards_for_user(user_id)
+        return list(self.shards)
+
+class IdentitySession(ShardedSession):
+    """Session over the sharded identity store.
+
+    Users, social accounts and refresh tokens are placed on the shard chosen by
+    their user id. New emails and external ids are written to the directory
+    database in the same unit of work, which also keeps them unique across
+    shards. The directory commits and rolls back with the session's root
+    transaction, right after the shards commit; a failure in between, or a stale
+    entry left by any other partial write, is repaired with
+    ``python -m lib.tools.rebalance_shards --rebuild-directory``, which adds
+    missing entries and removes entries no shard backs.
+    """
+
+    def __init__(self, router: ShardRouter, **kwargs):
+        super().__init__(
+            shards=router.shards,
+            shard_chooser=router.shard_chooser,
+            identity_chooser=router.identity_chooser,
+            execute_chooser=router.execute_chooser,
+            **kwargs
+        )
+        self.router = router
+        self.directory = router.DirectorySession()
+
+    def close(self):
+        # Uncommitted directory work is discarded along with the shard work
+        super().close()
+        self.directory.close()
+
+# The directory follows the session's root transaction through events, so
+# commit(), rollback() and "with session.begin():" all keep it in step
+@event.listens_for(IdentitySession, "after_commit")
+def _commit_directory(session):
+    session.directory.commit()
+
+@event.listens_for(IdentitySession, "after_soft_rollback")
+def _rollback_directory(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.directory.rollback()
+
+@event.listens_for(IdentitySession, "before_flush")
+def _update_directory(session, flush_context, instances):
+    for obj in session.new:
+        if isinstance(obj, User):
+            session.directory.add(UserDirectory(email=obj.email, user_id=obj.id))
+        elif isinstance(obj, SocialAccount):
+            session.directory.add(SocialDirectory(external_id=obj.external_id, user_id=obj.user_id))
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            session.directory.query(UserDirectory).filter(UserDirectory.email == obj.email).delete()
+        elif isinstance(obj, SocialAccount):
+            session.directory.query(SocialDirectory).filter(
+                SocialDirectory.external_id == obj.external_id
+            ).delete()
+    # Duplicate emails or external ids fail here, before any shard is written
+    session.directory.flush()
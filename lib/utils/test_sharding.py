@@ -0,0 +1,281 @@
+import pytest
+import uuid
+from datetime import datetime, timezone
+from sqlalchemy import and_, event, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from lib.models import User, SocialAccount, RefreshToken, UserDirectory, SocialDirectory
+from lib.services.auth_service import (
+    register_user, authenticate_user, issue_tokens, logout, link_or_create_user_via_social, find_user_by_email
+)
+from lib.services.export_service import iter_users
+from lib.tools.rebalance_shards import move_user, prune_directory, rebalance, rebuild_directory
+from lib.utils.sharding import IdentitySession, ShardRouter, jump_hash, shard_for_user
+
+def register_users(make_session, count):
+    # Close each session so its pooled connection returns before the next one
+    user_ids = []
+    for i in range(count):
+        with make_session() as db:
+            user_ids.append(register_user(db, f"user{i}@example.com", "secret"))
+    return user_ids
+
+def make_router(tmp_path, shard_count, previous_shard_count=None):
+    urls = [f"sqlite:///{tmp_path}/shard{i}.db" for i in range(shard_count)]
+    router = ShardRouter(urls, f"sqlite:///{tmp_path}/directory.db", previous_shard_count)
+    router.create_all()
+    return router
+
+@pytest.fixture
+def router(tmp_path):
+    return make_router(tmp_path, 3)
+
+@pytest.fixture
+def make_session(router):
+    SessionLocal = sessionmaker(class_=IdentitySession, router=router, autoflush=False)
+    sessions = []
+
+    def factory():
+        session = SessionLocal()
+        sessions.append(session)
+        return session
+
+    yield factory
+    for session in sessions:
+        session.close()
+
+@pytest.fixture
+def shard_queries(router):
+    # Count statements issued against each shard
+    counts = {shard_id: 0 for shard_id in router.shards}
+    for shard_id, engine in router.shards.items():
+        event.listen(engine, "before_cursor_execute",
+                     lambda *args, shard_id=shard_id: counts.__setitem__(shard_id, counts[shard_id] + 1))
+    return counts
+
+def users_on_shard(router, shard_id):
+    with sessionmaker(bind=router.shards[shard_id])() as session:
+        return {u.id for u in session.query(User)}
+
+def test_jump_hash_moves_only_to_new_shard():
+    keys = range(2000)
+    before = [jump_hash(k, 3) for k in keys]
+    after = [jump_hash(k, 4) for k in keys]
+    moved = [(b, a) for b, a in zip(before, after) if b != a]
+    assert all(a == 3 for _, a in moved)
+    assert 300 < len(moved) < 700
+    assert shard_for_user("u1", 3) == shard_for_user("u1", 3)
+
+def test_register_and_login_routed_to_one_shard(router, make_session, shard_queries):
+    db = make_session()
+    user_id = register_user(db, "player@example.com", "secret")
+    home = router.shard_for_user(user_id)
+    assert users_on_shard(router, home) == {user_id}
+
+    for shard_id in shard_queries:
+        shard_queries[shard_id] = 0
+    db = make_session()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr("lib.services.auth_service.verify_password", lambda plain, hashed: True)
+        assert authenticate_user(db, "player@example.com", "secret") == user_id
+    assert shard_queries[home] == 1
+    assert sum(shard_queries.values()) == 1
+
+def test_register_duplicate_email(make_session):
+    register_user(make_session(), "player@example.com", "secret")
+    with pytest.raises(ValueError) as exc:
+        register_user(make_session(), "player@example.com", "secret")
+    assert "already exists" in str(exc.value)
+
+def test_email_unique_across_shards(router, make_session):
+    ids = [str(uuid.uuid4()) for _ in range(20)]
+    first = ids[0]
+    second = next(i for i in ids if router.shard_for_user(i) != router.shard_for_user(first))
+    db = make_session()
+    db.add(User(id=first, email="player@example.com", hashed_password="x"))
+    db.commit()
+
+    db = make_session()
+    db.add(User(id=second, email="player@example.com", hashed_password="x"))
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
+    assert users_on_shard(router, router.shard_for_user(second)) == set()
+
+def test_directory_follows_begin_block(router):
+    SessionLocal = sessionmaker(class_=IdentitySession, router=router, autoflush=False)
+    with SessionLocal() as db:
+        with db.begin():
+            db.add(User(id="u1", email="begin@example.com", hashed_password="x"))
+    with SessionLocal() as db:
+        assert find_user_by_email(db, "begin@example.com").id == "u1"
+
+    with SessionLocal() as db:
+        with pytest.raises(RuntimeError):
+            with db.begin():
+                db.add(User(id="u2", email="aborted@example.com", hashed_password="x"))
+                db.flush()
+                raise RuntimeError("abort")
+    with router.DirectorySession() as directory:
+        assert directory.get(UserDirectory, "aborted@example.com") is None
+    assert all("u2" not in users_on_shard(router, shard_id) for shard_id in router.shards)
+
+def test_unknown_email_queries_single_shard(make_session, shard_queries):
+    assert find_user_by_email(make_session(), "nobody@example.com") is None
+    assert sum(shard_queries.values()) == 1
+
+def test_or_criteria_fan_out(router, make_session):
+    ids = [str(uuid.uuid4()) for _ in range(20)]
+    first = ids[0]
+    second = next(i for i in ids if router.shard_for_user(i) != router.shard_for_user(first))
+    db = make_session()
+    db.add(User(id=first, email="a@example.com", hashed_password="x"))
+    db.add(User(id=second, email="b@example.com", hashed_password="x"))
+    db.commit()
+
+    db = make_session()
+    either = db.query(User).filter(or_(User.email == "a@example.com", User.email == "b@example.com")).all()
+    assert {u.id for u in either} == {first, second}
+    # An AND conjunct still routes even when another term is an OR
+    both = db.query(User).filter(
+        and_(User.email == "a@example.com", or_(User.is_active == True, User.is_active == None))
+    ).all()
+    assert [u.id for u in both] == [first]
+
+def test_social_account_and_tokens_follow_user(router, make_session, shard_queries):
+    db = make_session()
+    user_id = link_or_create_user_via_social(db, "google", "google-123", "social@example.com")
+    access, refresh = issue_tokens(db, user_id)
+    home = router.shard_for_user(user_id)
+
+    with sessionmaker(bind=router.shards[home])() as shard:
+        assert shard.query(SocialAccount).filter_by(user_id=user_id).count() == 1
+        assert shard.query(RefreshToken).filter_by(user_id=user_id).count() == 1
+    with router.DirectorySession() as directory:
+        assert directory.get(SocialDirectory, "google-123").user_id == user_id
+
+    for shard_id in shard_queries:
+        shard_queries[shard_id] = 0
+    db = make_session()
+    logout(db, refresh)
+    assert sum(n for shard_id, n in shard_queries.items() if shard_id != home) == 0
+    with sessionmaker(bind=router.shards[home])() as shard:
+        assert shard.query(RefreshToken).filter_by(token=refresh).one().revoked is True
+
+def test_export_sharded(make_session):
+    emails = [f"user{i}@example.com" for i in range(12)]
+    for i, email in enumerate(emails):
+        with make_session() as db:
+            link_or_create_user_via_social(db, "google", f"google-{i}", email)
+    rows = list(iter_users(make_session(), batch_size=2))
+    assert sorted(r["email"] for r in rows) == sorted(emails)
+    by_email = {r["email"]: r["social_accounts"] for r in rows}
+    assert all(by_email[email] == [{"provider": "google", "external_id": f"google-{i}"}]
+               for i, email in enumerate(emails))
+
+def test_rebalance_after_adding_shard(tmp_path, make_session):
+    user_ids = register_users(make_session, 30)
+    for user_id in user_ids:
+        with make_session() as db:
+            issue_tokens(db, user_id)
+
+    grown = make_router(tmp_path, 4)
+    assert rebalance(grown, dry_run=True)
+    moved = rebalance(grown, batch_size=4)
+    assert all(target == "3" for _, target in moved)
+
+    for shard_id in grown.shards:
+        expected = {u for u in user_ids if grown.shard_for_user(u) == shard_id}
+        assert users_on_shard(grown, shard_id) == expected
+        with sessionmaker(bind=grown.shards[shard_id])() as shard:
+            assert {t.user_id for t in shard.query(RefreshToken)} == expected
+    assert rebalance(grown) == {}
+
+    db = sessionmaker(class_=IdentitySession, router=grown)()
+    assert find_user_by_email(db, "user7@example.com").id == user_ids[7]
+    db.close()
+
+def test_layout_change_served_during_rebalance(tmp_path, make_session):
+    user_ids = register_users(make_session, 30)
+    grown = make_router(tmp_path, 4, previous_shard_count=3)
+    GrownSession = sessionmaker(class_=IdentitySession, router=grown, autoflush=False)
+    moved = [(i, u) for i, u in enumerate(user_ids) if grown.shard_for_user(u) != shard_for_user(u, 3)]
+    assert moved
+    i, user_id = moved[0]
+    old_home = shard_for_user(user_id, 3)
+
+    with GrownSession() as db:
+        assert find_user_by_email(db, f"user{i}@example.com").id == user_id
+        with pytest.raises(ValueError):
+            register_user(db, f"user{i}@example.com", "secret")
+    with GrownSession() as db:
+        assert link_or_create_user_via_social(db, "google", "google-moved", f"user{i}@example.com") == user_id
+        access, refresh = issue_tokens(db, user_id)
+    # New rows follow the user to the shard that still holds it
+    with sessionmaker(bind=grown.shards[old_home])() as shard:
+        assert shard.query(RefreshToken).filter_by(token=refresh).count() == 1
+        assert shard.query(SocialAccount).filter_by(user_id=user_id).count() == 1
+    with GrownSession() as db:
+        logout(db, refresh)
+
+    rebalance(grown)
+    assert rebalance(grown) == {}
+    with sessionmaker(bind=grown.shards["3"])() as shard:
+        assert shard.query(RefreshToken).filter_by(token=refresh).one().revoked is True
+        assert shard.query(SocialAccount).filter_by(user_id=user_id).count() == 1
+    assert users_on_shard(grown, old_home) & {user_id} == set()
+
+def test_previous_shard_count_must_not_exceed_shards(tmp_path):
+    with pytest.raises(ValueError):
+        make_router(tmp_path, 2, previous_shard_count=3)
+
+def test_move_user_resumes_interrupted_copy(router):
+    source, target = router.shards["0"], router.shards["1"]
+    with sessionmaker(bind=source)() as db:
+        db.add(User(id="u1", email="mover@example.com", hashed_password="x", is_active=False))
+        db.add(RefreshToken(token="t1", user_id="u1", expires_at=datetime.now(timezone.utc), revoked=False))
+        db.add(RefreshToken(token="t2", user_id="u1", expires_at=datetime.now(timezone.utc), revoked=False))
+        db.commit()
+    # An interrupted run already copied a stale version of the user only
+    with sessionmaker(bind=target)() as db:
+        db.add(User(id="u1", email="mover@example.com", hashed_password="x", is_active=True))
+        db.commit()
+
+    move_user(source, target, "u1")
+    with sessionmaker(bind=target)() as db:
+        assert db.get(User, "u1").is_active is False
+        assert {t.token for t in db.query(RefreshToken)} == {"t1", "t2"}
+    assert users_on_shard(router, "0") == set()
+
+def test_rebalance_drains_unsharded_database(tmp_path, router, make_session):
+    legacy_url = f"sqlite:///{tmp_path}/legacy.db"
+    legacy = ShardRouter([legacy_url], f"sqlite:///{tmp_path}/legacy_directory.db")
+    legacy.create_all()
+    with sessionmaker(bind=legacy.shards["0"])() as db:
+        db.add(User(id="u1", email="legacy@example.com", hashed_password="x"))
+        db.add(SocialAccount(id="s1", user_id="u1", provider="google", external_id="google-1"))
+        db.commit()
+
+    rebalance(router, [legacy_url])
+    assert rebuild_directory(router) == 2
+    assert users_on_shard(legacy, "0") == set()
+    assert find_user_by_email(make_session(), "legacy@example.com").id == "u1"
+    with router.DirectorySession() as directory:
+        assert directory.get(UserDirectory, "legacy@example.com").user_id == "u1"
+
+def test_prune_directory_removes_stale_entries(router, make_session):
+    user_id = link_or_create_user_via_social(make_session(), "google", "google-1", "kept@example.com")
+    with router.DirectorySession() as directory:
+        # Left behind by a write whose shard commit never happened
+        directory.add(UserDirectory(email="stale@example.com", user_id="ghost"))
+        directory.add(SocialDirectory(external_id="google-ghost", user_id="ghost"))
+        # Points at the wrong owner
+        directory.add(UserDirectory(email="wrong@example.com", user_id=user_id))
+        directory.commit()
+
+    assert prune_directory(router, batch_size=1) == 3
+    with router.DirectorySession() as directory:
+        assert {e.email for e in directory.query(UserDirectory)} == {"kept@example.com"}
+        assert {e.external_id for e in directory.query(SocialDirectory)} == {"google-1"}
+    register_user(make_session(), "stale@example.com", "secret")
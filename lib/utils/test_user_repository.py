@@ -0,0 +1,32 @@
+import uuid
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from lib.models import Base, User
+from lib.utils.user_repository import get_or_create_social_user
+
+def test_get_or_create_social_user_concurrent_create(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/auth.db")
+    Base.metadata.create_all(engine)
+    SessionLocal = sessionmaker(bind=engine)
+    rival_id = str(uuid.uuid4())
+
+    db = SessionLocal()
+    raced = []
+
+    @event.listens_for(db, "before_commit")
+    def rival_login(session):
+        # Another login creates the same user after our lookup missed
+        if raced:
+            return
+        raced.append(True)
+        with SessionLocal() as rival:
+            rival.add(User(id=rival_id, email="player@example.com", hashed_password="x"))
+            rival.commit()
+
+    user_id = get_or_create_social_user(db, "player@example.com", "google-123", provider="google")
+    db.close()
+
+    assert user_id == rival_id
+    with SessionLocal() as check:
+        assert check.query(User).count() == 1
@@ -1,3 +1,4 @@
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from lib.models import User
 from lib.services.hashing_service import hash_password
@@ -12,6 +13,11 @@ def get_or_create_social_user(db: Session, email: str, external_id: str, provide
             hashed_password=hash_password(uuid.uuid4().hex) # dummy password
         )
         db.add(user)
-        db.commit()
+        try:
+            db.commit()
+        except IntegrityError:
+            # A concurrent login with the same email created the user first
+            db.rollback()
+            return db.query(User).filter(User.email == email).one().id
         db.refresh(user)
     return user.id